@@ -2,15 +2,69 @@
 Cliente HTTP para el backend LLM (llama.cpp con API tipo OpenAI).
 Conecta a un servidor que expone /v1/chat/completions (p. ej. http://host.docker.internal:8080).
 """
+import hashlib
+import json
 import os
+import tempfile
+import httpx
 import requests
-from typing import Optional
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+from typing import AsyncIterator, Iterator, List, Optional
+from urllib3.util import Timeout
+from urllib3.util.retry import Retry
+
+# Lo que sigue es el texto real que recibe el LLM (no es documentación).
+# El prompt completo es PROMPT_PREFIX + contexto + PROMPT_SUFFIX_TEMPLATE + instrucción.
+PROMPT_PREFIX = """Eres un experto en lingüística comparativa especializado en griego koiné y español.
+
+CONTEXTO (usa SOLO este texto):
+"""
+
+PROMPT_SUFFIX_TEMPLATE = """
+
+INSTRUCCIONES:
+- Realiza una comparación LINGÜÍSTICA (no teológica)
+- Analiza palabras clave, matices de traducción y estructura gramatical
+- Cita siempre el libro, capítulo y versículo
+- Indica claramente el idioma de cada texto
+- Explica que el griego es el texto original
+- Si el contexto no contiene el versículo solicitado, indica que no se encontró
+
+"""
+
+
+def _parse_sse_line(line: str) -> Optional[str]:
+    """
+    Extrae el texto de una línea SSE de la API tipo OpenAI ("data: {json}").
+
+    Returns:
+        El fragmento de texto ("" si la línea no aporta contenido) o None al
+        llegar a "data: [DONE]".
+
+    Raises:
+        ValueError: si la línea no es JSON válido o el servidor envía un evento de error.
+    """
+    if not line or not line.startswith("data: "):
+        return ""
+    data = line[len("data: "):].strip()
+    if data == "[DONE]":
+        return None
+    event = json.loads(data)
+    if event.get("error"):
+        error = event["error"]
+        message = error.get("message", error) if isinstance(error, dict) else error
+        raise ValueError(f"el servidor devolvió un error: {message}")
+    choices = event.get("choices") or []
+    if choices and isinstance(choices[0].get("delta"), dict):
+        return choices[0]["delta"].get("content") or ""
+    return ""
 
 
 class LLMClient:
     """
     Cliente para comunicarse con un servidor llama.cpp vía HTTP (API compatible OpenAI).
-    Configuración vía variables de entorno: LLM_BASE_URL, LLM_MODEL.
+    Configuración vía variables de entorno: LLM_BASE_URL, LLM_MODEL, LLM_CACHE_DIR.
     """
 
     def __init__(self, base_url: Optional[str] = None, model: Optional[str] = None):
@@ -26,6 +80,67 @@ class LLMClient:
         self.model = model or os.environ.get("LLM_MODEL", "Phi-3 Mini Instruct")
         self.chat_url = f"{self.base_url}/v1/chat/completions"
         self.timeout = 120
+        # Caché en disco de respuestas (model, plantilla, contexto, prompt) -> texto
+        self.cache_dir = Path(os.environ.get("LLM_CACHE_DIR", "./.llm_cache"))
+
+        # Sesión con pool keep-alive: evita un handshake TCP/TLS por cada petición.
+        # La instancia vive en st.cache_resource, así que el pool se reutiliza entre reruns.
+        # read=0: un timeout o error de lectura en el POST no se repite (sería relanzar la
+        # generación completa en llama.cpp); solo se reintentan conexión y 502/503/504
+        retry = Retry(
+            total=2,
+            connect=2,
+            read=0,
+            status=2,
+            backoff_factor=0.2,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=frozenset({"GET", "POST"}),
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._warm_up()
+
+        # Cliente asíncrono para quien consuma el LLM desde un event loop (agenerate_stream).
+        # Se crea al primer uso: la UI es síncrona y no debe abrir un pool que nadie cierra
+        self._aclient: Optional[httpx.AsyncClient] = None
+
+    def _warm_up(self):
+        """Abre la conexión del pool con una petición barata para que la primera generación no pague el handshake."""
+        url = f"{self.base_url}/v1/models"
+        try:
+            # Directo sobre el pool del adapter: misma conexión keep-alive que usará la sesión, pero sin
+            # el Retry del adapter, para que un host inalcanzable no bloquee el arranque varias veces
+            pool = self._session.get_adapter(url).poolmanager
+            pool.urlopen("GET", url, retries=False, timeout=Timeout(connect=1, read=2)).release_conn()
+        except Exception:
+            # El servidor puede no estar levantado todavía; generate_stream informará del error
+            pass
+
+    def close(self):
+        """Cierra la sesión HTTP y libera las conexiones del pool."""
+        session = getattr(self, "_session", None)
+        if session is not None:
+            session.close()
+
+    async def aclose(self):
+        """Cierra el cliente asíncrono, si llegó a crearse."""
+        if self._aclient is not None:
+            await self._aclient.aclose()
+            self._aclient = None
+
+    def _get_aclient(self) -> httpx.AsyncClient:
+        """Devuelve el cliente asíncrono, creándolo la primera vez."""
+        if self._aclient is None:
+            self._aclient = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_keepalive_connections=4),
+            )
+        return self._aclient
+
+    def __del__(self):
+        self.close()
 
     def generate(self, prompt: str, context: str) -> str:
         """
@@ -39,48 +154,137 @@ class LLMClient:
         Returns:
             Respuesta del modelo como texto.
         """
-        # Lo que sigue es el texto real que recibe el LLM (no es documentación)
-        full_prompt = f"""Eres un experto en lingüística comparativa especializado en griego koiné y español.
+        return "".join(self.generate_stream(prompt, context)).strip()
 
-CONTEXTO (usa SOLO este texto):
-{context}
+    def generate_stream(self, prompt: str, context: str) -> Iterator[str]:
+        """
+        Igual que generate(), pero devuelve los tokens a medida que llegan (SSE).
 
-INSTRUCCIONES:
-- Realiza una comparación LINGÜÍSTICA (no teológica)
-- Analiza palabras clave, matices de traducción y estructura gramatical
-- Cita siempre el libro, capítulo y versículo
-- Indica claramente el idioma de cada texto
-- Explica que el griego es el texto original
-- Si el contexto no contiene el versículo solicitado, indica que no se encontró
+        Args:
+            prompt: Prompt para el modelo (instrucción de comparación).
+            context: Contexto (versículo recuperado) a usar para la comparación.
+
+        Yields:
+            Fragmentos de texto de la respuesta del modelo.
+        """
+        cache_path = self._cache_path(prompt, context)
+        try:
+            yield cache_path.read_text(encoding="utf-8")
+            return
+        except OSError:
+            pass
 
-{prompt}"""
+        parts = []
+        done = False
+        try:
+            with self._session.post(
+                self.chat_url,
+                json=self._payload(prompt, context),
+                timeout=self.timeout,
+                stream=True,
+            ) as resp:
+                resp.raise_for_status()
+                # llama.cpp envía text/event-stream sin charset y requests asumiría ISO-8859-1
+                resp.encoding = "utf-8"
+                for line in resp.iter_lines(decode_unicode=True):
+                    content = _parse_sse_line(line)
+                    if content is None:
+                        done = True
+                        break
+                    if content:
+                        parts.append(content)
+                        yield content
+        except (requests.exceptions.RequestException, ValueError) as e:
+            yield self._error_message(e)
+            return
 
-        payload = {
+        # Sin [DONE] la respuesta puede estar truncada (el servidor cortó el stream): no se cachea
+        if done:
+            self._finish(cache_path, parts)
+
+    async def agenerate_stream(self, prompt: str, context: str) -> AsyncIterator[str]:
+        """
+        Versión asíncrona de generate_stream() (httpx.AsyncClient).
+
+        Args:
+            prompt: Prompt para el modelo (instrucción de comparación).
+            context: Contexto (versículo recuperado) a usar para la comparación.
+
+        Yields:
+            Fragmentos de texto de la respuesta del modelo.
+        """
+        cache_path = self._cache_path(prompt, context)
+        try:
+            yield cache_path.read_text(encoding="utf-8")
+            return
+        except OSError:
+            pass
+
+        parts = []
+        done = False
+        try:
+            async with self._get_aclient().stream(
+                "POST",
+                self.chat_url,
+                json=self._payload(prompt, context),
+            ) as resp:
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    content = _parse_sse_line(line)
+                    if content is None:
+                        done = True
+                        break
+                    if content:
+                        parts.append(content)
+                        yield content
+        except (httpx.HTTPError, ValueError) as e:
+            yield self._error_message(e)
+            return
+
+        # Sin [DONE] la respuesta puede estar truncada (el servidor cortó el stream): no se cachea
+        if done:
+            self._finish(cache_path, parts)
+
+    def _payload(self, prompt: str, context: str) -> dict:
+        """Cuerpo de la petición /v1/chat/completions en modo streaming."""
+        full_prompt = PROMPT_PREFIX + context + PROMPT_SUFFIX_TEMPLATE + prompt
+        return {
             "model": self.model,
             "messages": [{"role": "user", "content": full_prompt}],
-            "stream": False,
+            "stream": True,
         }
 
+    def _error_message(self, error: Exception) -> str:
+        """Mensaje mostrado al usuario cuando el servidor no responde correctamente."""
+        return (
+            f"Error al generar respuesta: {error}\n\n"
+            f"Asegúrate de que:\n"
+            f"1. El servidor llama.cpp esté corriendo en el host\n"
+            f"2. El endpoint {self.chat_url} sea accesible desde el contenedor\n"
+            f"3. Las variables LLM_BASE_URL y LLM_MODEL estén configuradas si usas valores distintos"
+        )
+
+    def _finish(self, cache_path: Path, parts: List[str]):
+        """Guarda una respuesta completa (terminada en [DONE]) en caché; nunca los mensajes de error."""
+        if parts:
+            self._write_cache(cache_path, "".join(parts))
+
+    def _cache_path(self, prompt: str, context: str) -> Path:
+        """Ruta del fichero de caché para (model, plantilla, contexto, prompt)."""
+        # La plantilla entra en la clave: si cambia el prompt del sistema, no se sirven análisis viejos
+        key = hashlib.sha256(
+            f"{self.model}|{PROMPT_PREFIX}|{PROMPT_SUFFIX_TEMPLATE}|{context}|{prompt}".encode("utf-8")
+        ).hexdigest()
+        return self.cache_dir / f"{key}.txt"
+
+    def _write_cache(self, path: Path, text: str):
+        """Escribe la respuesta de forma atómica; si el disco no es escribible, no cachea."""
         try:
-            resp = requests.post(
-                self.chat_url,
-                json=payload,
-                timeout=self.timeout,
-            )
-            resp.raise_for_status()
-            data = resp.json()
-            # API tipo OpenAI: choices[0].message.content
-            choices = data.get("choices") or []
-            if choices and isinstance(choices[0].get("message"), dict):
-                return (choices[0]["message"].get("content") or "").strip()
-            if choices and isinstance(choices[0], dict) and "message" in choices[0]:
-                return (choices[0]["message"].get("content") or "").strip()
-            return str(data)
-        except requests.exceptions.RequestException as e:
-            return (
-                f"Error al generar respuesta: {e}\n\n"
-                f"Asegúrate de que:\n"
-                f"1. El servidor llama.cpp esté corriendo en el host\n"
-                f"2. El endpoint {self.chat_url} sea accesible desde el contenedor\n"
-                f"3. Las variables LLM_BASE_URL y LLM_MODEL estén configuradas si usas valores distintos"
-            )
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=path.parent, suffix=".tmp", delete=False
+            ) as tmp:
+                tmp.write(text)
+            os.replace(tmp.name, path)
+        except OSError as e:
+            print(f"No se pudo escribir la caché del LLM: {e}")
@@ -11,7 +11,7 @@ if str(root_dir) not in sys.path:
     sys.path.insert(0, str(root_dir))
 
 import streamlit as st
-from app.rag import NTRAG
+from app.rag import EMBEDDING_MODEL_NAME, NTRAG, load_embedding_model
 from app.llm_client import LLMClient
 
 
@@ -25,6 +25,12 @@ def _llm_disabled() -> bool:
     return False
 
 
+# Instrucción de comparación que se envía al LLM junto con el contexto del versículo
+_COMPARE_PROMPT = """Realiza una comparación lingüística entre el texto griego original y la traducción al español.
+Analiza: 1) Palabras clave y su traducción 2) Matices de significado 3) Estructura gramatical 4) Notas gramaticales relevantes.
+Mantén la respuesta concisa y enfocada en aspectos lingüísticos."""
+
+
 # Configuración de la página
 st.set_page_config(
     page_title="NT Language Lab",
@@ -38,10 +44,23 @@ st.markdown("### Comparador de Traducciones del Nuevo Testamento")
 st.markdown("Comparación lingüística entre el texto original en griego koiné y la traducción Reina-Valera 1960")
 
 # Inicializar componentes (con cache)
+@st.cache_resource
+def _load_embedder():
+    """Carga el modelo de embeddings una sola vez por proceso y lo calienta."""
+    model = load_embedding_model()
+    model.encode("warmup")
+    return model
+
 @st.cache_resource
 def init_rag():
-    """Inicializa el sistema RAG."""
-    return NTRAG()
+    """Inicializa el sistema RAG con el modelo de embeddings ya cargado."""
+    rag = NTRAG(create_if_missing=False)
+    try:
+        rag._embedding_model = _load_embedder()
+    except Exception as e:
+        # La búsqueda por referencia no necesita el modelo; se reintentará al buscar por concepto
+        print(f"No se pudo precargar el modelo de embeddings: {e}")
+    return rag
 
 @st.cache_resource
 def init_llm():
@@ -53,6 +72,7 @@ try:
     rag = init_rag()
 except Exception as e:
     st.error(f"❌ Error inicializando RAG: {e}")
+    st.info("💡 Construye la base de datos con `python scripts/build_db.py` (o `scripts/ingest.py`).")
     st.stop()
 
 if _llm_disabled():
@@ -64,6 +84,28 @@ else:
         st.warning(f"⚠️ Error inicializando LLM: {e}")
         llm = None
 
+# Incrementar si se vuelve a ingestar la BD, para invalidar las búsquedas cacheadas
+_DB_VERSION = 1
+
+@st.cache_data(max_entries=2048, show_spinner=False)
+def _lookup_verse(libro: str, cap: int, vers: int, db_version: int):
+    """search_verse cacheado: el resultado es inmutable mientras no cambie la BD."""
+    return rag.search_verse(libro, cap, vers)
+
+@st.cache_data(max_entries=512, show_spinner=False, persist="disk")
+def _embed_query(query: str, model_name: str, space: str) -> list:
+    """Embedding de una consulta, cacheado entre reruns (y en disco entre reinicios).
+
+    El modelo y la métrica del índice forman parte de la clave para no reutilizar
+    vectores de otro modelo o sin normalizar.
+    """
+    return rag.encode_query(query)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _verse_count() -> int:
+    """Número de versículos indexados (la BD es inmutable en la app desplegada)."""
+    return rag.collection.count() // 2
+
 # Sidebar con información
 with st.sidebar:
     st.header("ℹ️ Información")
@@ -83,8 +125,7 @@ with st.sidebar:
         st.success("**Comparación con IA:** Activa")
         st.caption("llama.cpp configurado")
     try:
-        count = rag.collection.count()
-        st.info(f"📚 Versículos indexados: {count // 2}")
+        st.info(f"📚 Versículos indexados: {_verse_count()}")
     except Exception:
         st.warning("⚠️ ChromaDB no inicializado")
 
@@ -94,6 +135,24 @@ st.header("🔍 Buscar Versículo")
 tab_ref, tab_concept = st.tabs(["Por referencia", "Por concepto"])
 
 
+def _write_stream(chunks) -> str:
+    """Pinta los fragmentos de texto a medida que llegan y devuelve el texto completo."""
+    placeholder = st.empty()
+    text = ""
+    for chunk in chunks:
+        text += chunk
+        placeholder.markdown(text + "▌")
+    placeholder.markdown(text)
+    return text
+
+
+def _run_llm(verse_data) -> str:
+    """Genera (en streaming) y muestra la comparación lingüística de un versículo."""
+    context = rag.format_context(verse_data)
+    st.markdown("### Análisis")
+    return _write_stream(llm.generate_stream(_COMPARE_PROMPT, context))
+
+
 def _show_verse_detail(verse_data, show_llm=True, auto_llm=False):
     """Muestra detalle de un versículo (textos + opcional comparación LLM)."""
     libro = verse_data["libro"]
@@ -105,11 +164,11 @@ def _show_verse_detail(verse_data, show_llm=True, auto_llm=False):
     with c1:
         st.subheader("🇬🇷 Griego Koiné (Original)")
         st.markdown(f"**{libro} {cap}:{vers}**")
-        st.text_area("Texto griego", value=verse_data["griego"], height=150, disabled=True, key=f"g_{libro}_{cap}_{vers}")
+        st.markdown(f"> {verse_data['griego']}")
     with c2:
         st.subheader("🇪🇸 Reina-Valera 1960")
         st.markdown(f"**{libro} {cap}:{vers}**")
-        st.text_area("Texto español", value=verse_data["espanol"], height=150, disabled=True, key=f"e_{libro}_{cap}_{vers}")
+        st.markdown(f"> {verse_data['espanol']}")
     if not show_llm:
         return
     st.header("🔬 Comparación Lingüística")
@@ -117,25 +176,10 @@ def _show_verse_detail(verse_data, show_llm=True, auto_llm=False):
         st.warning("⚠️ El LLM no está disponible. No se puede generar la comparación lingüística.")
         st.info("💡 En la versión local con llama.cpp puedes activar la comparación con IA.")
     else:
-        if auto_llm:
+        # Con auto_llm el botón ni se muestra (cortocircuito del or)
+        if auto_llm or st.button("Generar comparación con IA", key=f"gen_{libro}_{cap}_{vers}"):
             with st.spinner("Generando comparación con IA..."):
-                context = rag.format_context(verse_data)
-                prompt = """Realiza una comparación lingüística entre el texto griego original y la traducción al español.
-Analiza: 1) Palabras clave y su traducción 2) Matices de significado 3) Estructura gramatical 4) Notas gramaticales relevantes.
-Mantén la respuesta concisa y enfocada en aspectos lingüísticos."""
-                comparacion = llm.generate(prompt, context)
-                st.markdown("### Análisis")
-                st.markdown(comparacion)
-        else:
-            if st.button("Generar comparación con IA", key=f"gen_{libro}_{cap}_{vers}"):
-                with st.spinner("Generando comparación..."):
-                    context = rag.format_context(verse_data)
-                    prompt = """Realiza una comparación lingüística entre el texto griego original y la traducción al español.
-Analiza: 1) Palabras clave y su traducción 2) Matices de significado 3) Estructura gramatical 4) Notas gramaticales relevantes.
-Mantén la respuesta concisa y enfocada en aspectos lingüísticos."""
-                    comparacion = llm.generate(prompt, context)
-                    st.markdown("### Análisis")
-                    st.markdown(comparacion)
+                _run_llm(verse_data)
 
 
 with tab_ref:
@@ -158,7 +202,7 @@ with tab_ref:
         versiculo = st.number_input("Versículo", min_value=1, max_value=200, value=1, step=1, key="ref_vers")
     if st.button("🔎 Buscar y Comparar", type="primary", key="btn_ref"):
         with st.spinner("Buscando versículo..."):
-            verse_data = rag.search_verse(libro, capitulo, versiculo)
+            verse_data = _lookup_verse(libro, int(capitulo), int(versiculo), _DB_VERSION)
             if verse_data:
                 _show_verse_detail(verse_data, show_llm=True, auto_llm=True)
             else:
@@ -166,23 +210,34 @@ with tab_ref:
                 st.info("💡 Asegúrate de que los datos hayan sido ingeridos correctamente.")
 
 with tab_concept:
-    st.markdown("Busca por **concepto o frase** (ej: *amor de Dios al mundo*). La primera vez puede tardar unos segundos en cargar el modelo.")
+    st.markdown("Busca por **concepto o frase** (ej: *amor de Dios al mundo*).")
     concept_query = st.text_input("Escribe un concepto o frase", placeholder="ej: amor de Dios al mundo", key="concept_query")
     if st.button("🔎 Buscar por concepto", type="primary", key="btn_concept"):
         if not (concept_query and concept_query.strip()):
             st.warning("Escribe una frase o concepto para buscar.")
+            st.session_state.pop("concept_results", None)
         else:
-            with st.spinner("Buscando por concepto… La primera vez puede tardar ~1 min (carga del modelo de búsqueda semántica)."):
-                verses = rag.search_by_concept(concept_query.strip(), top_k=10)
-            if not verses:
-                st.error("No se encontraron versículos similares.")
-                st.info("Prueba otra frase o asegúrate de que la ingesta se haya ejecutado.")
-            else:
-                st.success(f"Se encontraron {len(verses)} versículo(s). Elige uno para ver detalle.")
-                for i, v in enumerate(verses):
-                    ref = f"{v['libro']} {v['capitulo']}:{v['versiculo']}"
-                    preview = (v["espanol"][:60] + "...") if len(v["espanol"]) > 60 else v["espanol"]
-                    with st.expander(f"**{ref}** — {preview}"):
+            with st.spinner("Buscando por concepto…"):
+                try:
+                    verses = rag.search_by_embedding(_embed_query(concept_query.strip(), EMBEDDING_MODEL_NAME, rag.space), top_k=10)
+                except Exception as e:
+                    print(f"Error generando embedding para búsqueda semántica: {e}")
+                    verses = []
+            # Se guardan para que sigan visibles en los reruns (abrir detalle, generar comparación)
+            st.session_state["concept_results"] = verses
+    verses = st.session_state.get("concept_results")
+    if verses is not None:
+        if not verses:
+            st.error("No se encontraron versículos similares.")
+            st.info("Prueba otra frase o asegúrate de que la ingesta se haya ejecutado.")
+        else:
+            st.success(f"Se encontraron {len(verses)} versículo(s). Elige uno para ver detalle.")
+            for v in verses:
+                ref = f"{v['libro']} {v['capitulo']}:{v['versiculo']}"
+                preview = (v["espanol"][:60] + "...") if len(v["espanol"]) > 60 else v["espanol"]
+                with st.expander(f"**{ref}** — {preview}", expanded=False):
+                    # El detalle solo se renderiza para los versículos que el usuario abre
+                    if st.checkbox("Ver detalle", key=f"open_{ref}"):
                         _show_verse_detail(v, show_llm=True, auto_llm=False)
 
 # Footer
@@ -9,20 +9,47 @@ from sentence_transformers import SentenceTransformer
 from typing import Optional, List, Dict, Tuple
 
 
+# Modelo de embeddings usado en la ingesta y en la búsqueda por concepto.
+# Debe ser multilingüe (griego + español); cambiarlo obliga a re-ingestar la BD.
+EMBEDDING_MODEL_NAME = os.getenv('EMBEDDING_MODEL', 'paraphrase-multilingual-MiniLM-L12-v2')
+
+# Backend de inferencia: "torch" (por defecto) u "onnx" (más rápido en CPU, requiere
+# optimum[onnxruntime]). Con onnx, EMBEDDING_ONNX_FILE elige p. ej. un modelo int8.
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')
+EMBEDDING_ONNX_FILE = os.getenv('EMBEDDING_ONNX_FILE', '')
+
+# Colección de ChromaDB con los versículos (griego y español)
+COLLECTION_NAME = "nuevo_testamento"
+
+# Tamaño de lote para collection.upsert durante la ingesta
+ADD_BATCH_SIZE = 200
+
+
+def load_embedding_model() -> SentenceTransformer:
+    """Carga el modelo de embeddings con el backend configurado."""
+    if EMBEDDING_BACKEND == 'torch':
+        return SentenceTransformer(EMBEDDING_MODEL_NAME)
+    model_kwargs = {"file_name": EMBEDDING_ONNX_FILE} if EMBEDDING_ONNX_FILE else None
+    return SentenceTransformer(EMBEDDING_MODEL_NAME, backend=EMBEDDING_BACKEND, model_kwargs=model_kwargs)
+
+
 class NTRAG:
     """Sistema RAG para recuperar versículos del Nuevo Testamento."""
     
-    _embedding_model = None  # Carga perezosa: solo se usa en ingest, no en búsqueda
+    _embedding_model = None  # Carga perezosa; la app lo precarga al arrancar (main.init_rag)
     
-    def __init__(self, db_path: Optional[str] = None):
+    def __init__(self, db_path: Optional[str] = None, create_if_missing: bool = True):
         """
         Inicializa el sistema RAG.
         
         Args:
             db_path: Ruta donde se almacena ChromaDB. Por defecto usa variable
                      de entorno o ./chroma_db
+            create_if_missing: Si es False (la app), solo abre la colección de una BD
+                               ya construida; falla al inicio si no existe.
         """
         self.db_path = db_path or os.getenv('CHROMA_DB_PATH', './chroma_db')
+        self.create_if_missing = create_if_missing
         
         # ChromaDB se inicializa siempre (rápido)
         self.client = chromadb.PersistentClient(
@@ -30,16 +57,42 @@ class NTRAG:
             settings=Settings(anonymized_telemetry=False)
         )
         
-        self.collection = self.client.get_or_create_collection(
-            name="nuevo_testamento",
-            metadata={"description": "Versículos del Nuevo Testamento en griego y español"}
-        )
+        existing = {c.name for c in self.client.list_collections()}
+        if not create_if_missing or COLLECTION_NAME in existing:
+            # get_or_create_collection sobrescribiría los metadatos de una colección existente
+            self.collection = self.client.get_collection(name=COLLECTION_NAME)
+        else:
+            self.collection = self.client.create_collection(
+                name=COLLECTION_NAME,
+                metadata={
+                    "description": "Versículos del Nuevo Testamento en griego y español",
+                    "embedding_model": EMBEDDING_MODEL_NAME,
+                    # Embeddings normalizados: producto interno == coseno, y más barato
+                    "hnsw:space": "ip"
+                }
+            )
+        
+        collection_metadata = self.collection.metadata or {}
+        indexed_model = collection_metadata.get("embedding_model")
+        if indexed_model and indexed_model != EMBEDDING_MODEL_NAME:
+            print(f"⚠️ La colección se indexó con '{indexed_model}' pero EMBEDDING_MODEL es "
+                  f"'{EMBEDDING_MODEL_NAME}': la búsqueda por concepto no será fiable hasta re-ingestar")
+        
+        # Solo se normaliza si el índice lo espera; en una colección L2 antigua los
+        # vectores guardados no están normalizados y normalizar la consulta cambiaría el ranking
+        self.space = collection_metadata.get("hnsw:space", "l2")
+        self._normalize = self.space in ("ip", "cosine")
+        if not self._normalize:
+            print(f"⚠️ La colección usa la métrica '{self.space}'; reconstrúyela con "
+                  f"scripts/build_db.py para usar embeddings normalizados (producto interno)")
+        # count() consulta la BD; se cachea y solo se refresca al añadir versículos
+        self._doc_count = self.collection.count()
     
     def _get_embedding_model(self) -> SentenceTransformer:
-        """Carga el modelo de embeddings solo cuando se necesita (p. ej. en ingest)."""
-        if NTRAG._embedding_model is None:
-            NTRAG._embedding_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-        return NTRAG._embedding_model
+        """Devuelve el modelo de embeddings, cargándolo si nadie lo ha precargado."""
+        if self._embedding_model is None:
+            NTRAG._embedding_model = load_embedding_model()
+        return self._embedding_model
     
     def search_verse(
         self, 
@@ -63,89 +116,26 @@ class NTRAG:
         id_espanol = f"{libro}_{capitulo}_{versiculo}_espanol"
         
         try:
-            # Intentar obtener ambos documentos por ID
+            # Los IDs son deterministas: un get(ids) es suficiente
             results = self.collection.get(
-                ids=[id_griego, id_espanol]
+                ids=[id_griego, id_espanol],
+                include=["documents"]
             )
+            if not results or len(results['ids']) < 2:
+                return None
             
-            if results and len(results['ids']) >= 2:
-                # Ambos documentos encontrados
-                griego_idx = results['ids'].index(id_griego) if id_griego in results['ids'] else None
-                espanol_idx = results['ids'].index(id_espanol) if id_espanol in results['ids'] else None
-                
-                texto_griego = results['documents'][griego_idx] if griego_idx is not None else ""
-                texto_espanol = results['documents'][espanol_idx] if espanol_idx is not None else ""
-                
-                if texto_griego and texto_espanol:
-                    return {
-                        'griego': texto_griego,
-                        'espanol': texto_espanol,
-                        'libro': libro,
-                        'capitulo': capitulo,
-                        'versiculo': versiculo
-                    }
+            id_to_doc = dict(zip(results['ids'], results['documents']))
+            texto_griego = id_to_doc.get(id_griego, "")
+            texto_espanol = id_to_doc.get(id_espanol, "")
             
-            # Fallback: buscar por metadatos si no se encontró por ID
-            # ChromaDB puede requerir diferentes formatos según la versión
-            try:
-                results = self.collection.get(
-                    where={
-                        "$and": [
-                            {"libro": {"$eq": str(libro)}},
-                            {"capitulo": {"$eq": int(capitulo)}},
-                            {"versiculo": {"$eq": int(versiculo)}}
-                        ]
-                    }
-                )
-            except:
-                # Formato alternativo para versiones antiguas de ChromaDB
-                try:
-                    results = self.collection.get(
-                        where={
-                            "$and": [
-                                {"libro": libro},
-                                {"capitulo": capitulo},
-                                {"versiculo": versiculo}
-                            ]
-                        }
-                    )
-                except:
-                    # Último recurso: obtener todos y filtrar
-                    all_results = self.collection.get()
-                    if all_results and all_results['ids']:
-                        matching_ids = []
-                        for idx, metadata in enumerate(all_results['metadatas']):
-                            if (metadata.get('libro') == str(libro) and
-                                metadata.get('capitulo') == int(capitulo) and
-                                metadata.get('versiculo') == int(versiculo)):
-                                matching_ids.append(all_results['ids'][idx])
-                        
-                        if matching_ids:
-                            results = self.collection.get(ids=matching_ids)
-                        else:
-                            results = None
-                    else:
-                        results = None
-            
-            if results and len(results['ids']) >= 2:
-                # Separar griego y español
-                texto_griego = ""
-                texto_espanol = ""
-                
-                for idx, metadata in enumerate(results['metadatas']):
-                    if metadata.get('idioma') == 'griego':
-                        texto_griego = results['documents'][idx]
-                    elif metadata.get('idioma') == 'espanol':
-                        texto_espanol = results['documents'][idx]
-                
-                if texto_griego and texto_espanol:
-                    return {
-                        'griego': texto_griego,
-                        'espanol': texto_espanol,
-                        'libro': libro,
-                        'capitulo': capitulo,
-                        'versiculo': versiculo
-                    }
+            if texto_griego and texto_espanol:
+                return {
+                    'griego': texto_griego,
+                    'espanol': texto_espanol,
+                    'libro': libro,
+                    'capitulo': capitulo,
+                    'versiculo': versiculo
+                }
         except Exception as e:
             print(f"Error buscando versículo: {e}")
         
@@ -166,13 +156,40 @@ class NTRAG:
         if not query or not query.strip():
             return []
         try:
-            model = self._get_embedding_model()
-            query_embedding = model.encode(query.strip()).tolist()
+            query_embedding = self.encode_query(query)
         except Exception as e:
             print(f"Error generando embedding para búsqueda semántica: {e}")
             return []
+        return self.search_by_embedding(query_embedding, top_k=top_k)
+
+    def encode_query(self, query: str) -> List[float]:
+        """
+        Calcula el embedding de una frase de búsqueda.
+
+        Args:
+            query: Frase o concepto en español.
+
+        Returns:
+            Vector de embedding como lista de floats.
+        """
+        model = self._get_embedding_model()
+        return model.encode(query.strip(), normalize_embeddings=self._normalize).tolist()
+
+    def search_by_embedding(self, query_embedding: List[float], top_k: int = 10) -> List[Dict]:
+        """
+        Igual que search_by_concept, pero con el embedding de la consulta ya calculado
+        (permite que la UI lo cachee).
+
+        Args:
+            query_embedding: Embedding de la consulta (ver encode_query).
+            top_k: Número máximo de versículos a devolver.
+
+        Returns:
+            Lista de diccionarios con la misma estructura que search_verse,
+            ordenados por relevancia.
+        """
         try:
-            n_results = min(max(top_k * 2, 20), self.collection.count())
+            n_results = min(max(top_k * 2, 20), self._doc_count or (top_k * 2))
             if n_results < 1:
                 return []
             results = self.collection.query(
@@ -201,11 +218,34 @@ class NTRAG:
             unique_verses.append((str(libro), int(cap), int(vers)))
             if len(unique_verses) >= top_k:
                 break
+        if not unique_verses:
+            return []
+        # Un solo get(ids) para todos los versículos en lugar de uno por versículo
+        ids = [f"{l}_{c}_{v}_griego" for l, c, v in unique_verses] + \
+              [f"{l}_{c}_{v}_espanol" for l, c, v in unique_verses]
+        try:
+            results = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        except Exception as e:
+            print(f"Error recuperando versículos (semántica): {e}")
+            return []
+        docs = {}
+        for meta, doc in zip(results.get("metadatas") or [], results.get("documents") or []):
+            if not meta:
+                continue
+            key = (str(meta.get("libro")), int(meta.get("capitulo")), int(meta.get("versiculo")), meta.get("idioma"))
+            docs[key] = doc
         out = []
         for libro, cap, vers in unique_verses:
-            v = self.search_verse(libro, cap, vers)
-            if v:
-                out.append(v)
+            texto_griego = docs.get((libro, cap, vers, "griego"))
+            texto_espanol = docs.get((libro, cap, vers, "espanol"))
+            if texto_griego and texto_espanol:
+                out.append({
+                    'griego': texto_griego,
+                    'espanol': texto_espanol,
+                    'libro': libro,
+                    'capitulo': cap,
+                    'versiculo': vers
+                })
         return out
 
     def format_context(self, verse_data: Dict[str, str]) -> str:
@@ -248,8 +288,8 @@ TRADUCCIÓN (Reina-Valera 1960):
         """
         # Generar embeddings (carga el modelo solo aquí, en el script de ingesta)
         model = self._get_embedding_model()
-        embedding_griego = model.encode(texto_griego).tolist()
-        embedding_espanol = model.encode(texto_espanol).tolist()
+        embedding_griego = model.encode(texto_griego, normalize_embeddings=self._normalize).tolist()
+        embedding_espanol = model.encode(texto_espanol, normalize_embeddings=self._normalize).tolist()
         
         # IDs únicos
         id_griego = f"{libro}_{capitulo}_{versiculo}_griego"
@@ -270,17 +310,62 @@ TRADUCCIÓN (Reina-Valera 1960):
             "idioma": "espanol"
         }
         
-        # Añadir a la colección
-        self.collection.add(
+        # Añadir a la colección (upsert: re-ingestar no falla por IDs duplicados)
+        self.collection.upsert(
             ids=[id_griego],
             embeddings=[embedding_griego],
             documents=[texto_griego],
             metadatas=[metadata_griego]
         )
         
-        self.collection.add(
+        self.collection.upsert(
             ids=[id_espanol],
             embeddings=[embedding_espanol],
             documents=[texto_espanol],
             metadatas=[metadata_espanol]
         )
+        self._doc_count = self.collection.count()
+
+    def add_verses_batch(self, verses: List[Dict]):
+        """
+        Añade muchos versículos a la vez: un solo encode y un upsert por lote.
+        
+        Args:
+            verses: Lista de diccionarios con 'libro', 'capitulo', 'versiculo',
+                    'griego' y 'espanol' (mismo formato que las líneas de nt_verses.jsonl)
+        """
+        if not verses:
+            return
+        
+        texts = [v['griego'] for v in verses] + [v['espanol'] for v in verses]
+        ids = [f"{v['libro']}_{v['capitulo']}_{v['versiculo']}_griego" for v in verses] + \
+              [f"{v['libro']}_{v['capitulo']}_{v['versiculo']}_espanol" for v in verses]
+        metadatas = [
+            {
+                "libro": str(v['libro']),
+                "capitulo": int(v['capitulo']),
+                "versiculo": int(v['versiculo']),
+                "idioma": idioma
+            }
+            for idioma in ("griego", "espanol")
+            for v in verses
+        ]
+        
+        model = self._get_embedding_model()
+        embeddings = model.encode(
+            texts,
+            batch_size=64,
+            show_progress_bar=True,
+            convert_to_numpy=True,
+            normalize_embeddings=self._normalize
+        ).tolist()
+        
+        for start in range(0, len(ids), ADD_BATCH_SIZE):
+            end = start + ADD_BATCH_SIZE
+            self.collection.upsert(
+                ids=ids[start:end],
+                embeddings=embeddings[start:end],
+                documents=texts[start:end],
+                metadatas=metadatas[start:end]
+            )
+        self._doc_count = self.collection.count()
@@ -0,0 +1,50 @@
+"""
+Script para construir la base ChromaDB que se distribuye con la imagen.
+Ingiere nt_verses.jsonl en una carpeta nueva y, si todo fue bien, la
+sustituye por el snapshot publicado (por defecto ./chroma_db, que es lo que
+copia el Dockerfile). En producción la app abre ese snapshot en modo solo
+lectura y no ejecuta ninguna ingesta.
+"""
+import shutil
+import sys
+from pathlib import Path
+
+# Añadir el directorio raíz al path para importar módulos
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from scripts.ingest import ingest_data
+
+
+def build_db(data_path: str = "./data/nt_verses.jsonl", output_dir: str = "./chroma_db") -> bool:
+    """
+    Construye desde cero el snapshot de ChromaDB.
+    
+    Args:
+        data_path: Ruta al archivo JSONL (o JSON) con los versículos
+        output_dir: Carpeta del snapshot a generar
+        
+    Returns:
+        True si se generó el snapshot, False si la ingesta no produjo datos
+    """
+    output = Path(output_dir)
+    staging = output.with_name(output.name + ".tmp")
+    if staging.exists():
+        shutil.rmtree(staging)
+    
+    count = ingest_data(data_path, db_path=str(staging))
+    if not count:
+        print(f"❌ La ingesta no generó documentos; se conserva {output}")
+        shutil.rmtree(staging, ignore_errors=True)
+        return False
+    
+    if output.exists():
+        shutil.rmtree(output)
+    staging.rename(output)
+    print(f"📦 Snapshot de ChromaDB listo en {output}")
+    return True
+
+
+if __name__ == "__main__":
+    data_path = sys.argv[1] if len(sys.argv) > 1 else "./data/nt_verses.jsonl"
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else "./chroma_db"
+    sys.exit(0 if build_db(data_path, output_dir) else 1)
@@ -1,11 +1,12 @@
 """
 Script para ingerir datos del Nuevo Testamento en ChromaDB.
-Lee archivos JSON con los versículos en griego y español.
+Lee archivos JSONL (o JSON) con los versículos en griego y español.
 """
 import json
 import os
 import sys
 from pathlib import Path
+from typing import Optional
 
 # Añadir el directorio raíz al path para importar módulos
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -15,59 +16,51 @@ from app.rag import NTRAG
 
 def load_verses_from_json(json_path: str) -> list:
     """
-    Carga versículos desde un archivo JSON.
+    Carga versículos desde un archivo JSONL (.jsonl) o JSON.
     
-    Formato esperado:
-    [
-        {
-            "libro": "Mateo",
-            "capitulo": 1,
-            "versiculo": 1,
-            "griego": "Βίβλος γενέσεως...",
-            "espanol": "Libro de la genealogía..."
-        },
-        ...
-    ]
+    Formato esperado (JSONL, un objeto por línea, como genera process_data.py):
+    {"libro": "Mateo", "capitulo": 1, "versiculo": 1, "griego": "Βίβλος γενέσεως...", "espanol": "Libro de la genealogía..."}
+    ...
+    
+    Un .json con la lista completa de esos objetos también se acepta.
     
     Args:
-        json_path: Ruta al archivo JSON
+        json_path: Ruta al archivo JSONL o JSON
         
     Returns:
         Lista de diccionarios con los versículos
     """
     with open(json_path, 'r', encoding='utf-8') as f:
+        if json_path.endswith('.jsonl'):
+            return [json.loads(line) for line in f if line.strip()]
         return json.load(f)
 
 
-def ingest_data(data_path: str = "./data/nt_verses.json"):
+def ingest_data(data_path: str = "./data/nt_verses.jsonl", db_path: Optional[str] = None) -> int:
     """
     Ingiere datos del Nuevo Testamento en ChromaDB.
     
     Args:
-        data_path: Ruta al archivo JSON con los versículos
+        data_path: Ruta al archivo JSONL (o JSON) con los versículos
+        db_path: Ruta de ChromaDB. Por defecto la de NTRAG (CHROMA_DB_PATH o ./chroma_db)
+        
+    Returns:
+        Número de documentos en la colección tras la ingesta (0 si no hay datos)
     """
     print("🚀 Iniciando ingesta de datos del Nuevo Testamento...")
     
     # Verificar que existe el archivo
     if not os.path.exists(data_path):
         print(f"❌ Error: No se encuentra el archivo {data_path}")
-        print("💡 Crea un archivo JSON con el formato:")
+        print("💡 Genera el archivo con scripts/process_data.py o crea un JSONL (un versículo por línea):")
         print("""
-[
-    {
-        "libro": "Mateo",
-        "capitulo": 1,
-        "versiculo": 1,
-        "griego": "Texto en griego koiné...",
-        "espanol": "Texto en Reina-Valera 1960..."
-    }
-]
+{"libro": "Mateo", "capitulo": 1, "versiculo": 1, "griego": "Texto en griego koiné...", "espanol": "Texto en Reina-Valera 1960..."}
         """)
-        return
+        return 0
     
     # Inicializar RAG
     print("📚 Inicializando ChromaDB...")
-    rag = NTRAG()
+    rag = NTRAG(db_path=db_path)
     
     # Cargar datos
     print(f"📖 Cargando datos desde {data_path}...")
@@ -75,39 +68,36 @@ def ingest_data(data_path: str = "./data/nt_verses.json"):
     
     print(f"✅ Cargados {len(verses)} versículos")
     
-    # Ingerir versículos
-    print("💾 Ingeriendo versículos en ChromaDB...")
+    # Validar y normalizar versículos
+    batch = []
     for i, verse in enumerate(verses, 1):
         try:
             # Asegurar que capitulo y versiculo sean enteros
-            capitulo = int(verse['capitulo'])
-            versiculo = int(verse['versiculo'])
-            
-            rag.add_verse(
-                libro=str(verse['libro']),
-                capitulo=capitulo,
-                versiculo=versiculo,
-                texto_griego=str(verse['griego']),
-                texto_espanol=str(verse['espanol'])
-            )
-            
-            if i % 100 == 0:
-                print(f"  Procesados {i}/{len(verses)} versículos...")
+            batch.append({
+                "libro": str(verse['libro']),
+                "capitulo": int(verse['capitulo']),
+                "versiculo": int(verse['versiculo']),
+                "griego": str(verse['griego']),
+                "espanol": str(verse['espanol'])
+            })
         except KeyError as e:
             print(f"⚠️ Error: Falta campo requerido en versículo {i}: {e}")
         except ValueError as e:
             print(f"⚠️ Error: Tipo de dato inválido en versículo {i}: {e}")
-        except Exception as e:
-            print(f"⚠️ Error procesando {verse.get('libro', '?')} {verse.get('capitulo', '?')}:{verse.get('versiculo', '?')}: {e}")
+    
+    # Ingerir versículos (embeddings y escritura por lotes)
+    print(f"💾 Ingeriendo {len(batch)} versículos en ChromaDB...")
+    rag.add_verses_batch(batch)
     
     # Verificar ingesta
     count = rag.collection.count()
     print(f"\n✅ Ingesta completada!")
     print(f"📊 Total de documentos en ChromaDB: {count}")
     print(f"📖 Versículos únicos: {count // 2}")
+    return count
 
 
 if __name__ == "__main__":
     # Permitir especificar ruta como argumento
-    data_path = sys.argv[1] if len(sys.argv) > 1 else "./data/nt_verses.json"
+    data_path = sys.argv[1] if len(sys.argv) > 1 else "./data/nt_verses.jsonl"
     ingest_data(data_path)
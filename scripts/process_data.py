@@ -1,16 +1,33 @@
 """
 Script para procesar los datos del Nuevo Testamento desde las fuentes originales
-y generar el archivo JSON unificado para la ingesta.
+y generar el archivo JSONL unificado (un versículo por línea) para la ingesta.
 
 Fuentes:
 1. Reina-Valera 1960: /data/es_rvr/es_rvr.json
 2. Griego koiné: /data/greek_nt/*.txt
 """
-import json
+import codecs
+import functools
+import hashlib
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import groupby
+from operator import itemgetter
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional, Tuple
 
+import ijson
+import orjson
+
+
+# Buffer de lectura de 1 MiB: los ficheros fuente ocupan varios MB y con el
+# buffer por defecto (8 KiB) se harían cientos de read() por fichero
+READ_BUFFER_SIZE = 1 << 20
+
+# Clave plana de un versículo: (libro, capítulo, versículo)
+VerseKey = Tuple[str, int, int]
 
 # Mapeo de índices del JSON a nombres de libros del NT (índices 39-65)
 NT_BOOKS_JSON_INDICES = {
@@ -43,6 +60,20 @@ NT_BOOKS_JSON_INDICES = {
     65: ("Apocalipsis", "re"),
 }
 
+@dataclass(slots=True)
+class Verse:
+    """Registro de salida: mismos campos y orden que cada línea de nt_verses.jsonl."""
+    libro: str
+    capitulo: int
+    versiculo: int
+    griego: str
+    espanol: str
+
+
+# Orden canónico de los libros del NT (orden de lectura, no alfabético)
+ORDERED_BOOKS = [name for _, (name, _) in sorted(NT_BOOKS_JSON_INDICES.items())]
+BOOK_ORDER = {name: position for position, name in enumerate(ORDERED_BOOKS)}
+
 # Mapeo de archivos TXT a nombres de libros
 GREEK_FILE_MAPPING = {
     "61-Mt-morphgnt.txt": "Mateo",
@@ -75,142 +106,153 @@ GREEK_FILE_MAPPING = {
 }
 
 
-def load_spanish_nt(json_path: str) -> Dict[str, Dict[int, Dict[int, str]]]:
-    """Carga el Nuevo Testamento en español desde el JSON."""
-    print(f"📖 Cargando Reina-Valera 1960 desde {json_path}...")
+def _write_stats(lines: List[str]):
+    """Escribe el progreso por libro de una vez (un write en lugar de un print por libro)."""
+    if lines:
+        sys.stdout.write("\n".join(lines) + "\n")
+
+
+@functools.lru_cache(maxsize=1)
+def load_spanish_nt(json_path: str) -> Dict[VerseKey, str]:
+    """
+    Carga el Nuevo Testamento en español desde el JSON.
     
-    with open(json_path, 'r', encoding='utf-8-sig') as f:
-        bible_data = json.load(f)
+    El resultado se cachea por ruta (otra llamada en el mismo proceso no vuelve a
+    leer el fichero): quien lo use no debe modificar el diccionario devuelto.
+    """
+    print(f"📖 Cargando Reina-Valera 1960 desde {json_path}...")
     
     spanish_nt = {}
+    last_nt_index = max(NT_BOOKS_JSON_INDICES)
+    strip = str.strip  # referencia local: evita la búsqueda del atributo por versículo
+    stats = []
     
-    for json_idx, (book_name, abbrev) in NT_BOOKS_JSON_INDICES.items():
-        if json_idx < len(bible_data):
-            book_data = bible_data[json_idx]
+    # Parseo incremental: se construye un libro cada vez y los del AT se descartan
+    # sin llegar a tener la Biblia completa en memoria
+    with open(json_path, 'rb', buffering=READ_BUFFER_SIZE) as f:
+        # El JSON trae BOM (utf-8-sig) y ijson trabaja sobre bytes
+        if f.read(len(codecs.BOM_UTF8)) != codecs.BOM_UTF8:
+            f.seek(0)
+        
+        for json_idx, book_data in enumerate(ijson.items(f, 'item')):
+            if json_idx not in NT_BOOKS_JSON_INDICES:
+                continue
+            book_name, abbrev = NT_BOOKS_JSON_INDICES[json_idx]
+            # Un único objeto str por libro, compartido por todas sus claves y registros
+            book_name = sys.intern(book_name)
             chapters = book_data.get('chapters', [])
             
-            spanish_nt[book_name] = {}
+            spanish_nt.update(
+                ((book_name, chapter_num, verse_num), strip(verse_text) if verse_text else "")
+                for chapter_num, chapter_verses in enumerate(chapters, start=1)
+                for verse_num, verse_text in enumerate(chapter_verses, start=1)
+            )
             
-            for chapter_num, chapter_verses in enumerate(chapters, start=1):
-                spanish_nt[book_name][chapter_num] = {}
-                for verse_num, verse_text in enumerate(chapter_verses, start=1):
-                    verse_text = verse_text.strip() if verse_text else ""
-                    spanish_nt[book_name][chapter_num][verse_num] = verse_text
+            stats.append(f"  ✅ {book_name}: {len(chapters)} capítulos")
             
-            print(f"  ✅ {book_name}: {len(chapters)} capítulos")
+            if json_idx == last_nt_index:
+                break
     
+    _write_stats(stats)
     return spanish_nt
 
 
-def load_greek_nt(greek_dir: str) -> Dict[str, Dict[int, Dict[int, str]]]:
-    """Carga el Nuevo Testamento en griego desde los archivos TXT."""
-    print(f"📖 Cargando textos griegos desde {greek_dir}...")
+def _parse_greek_file(filepath: str, book_name: str) -> Tuple[str, Optional[Dict[Tuple[int, int], str]]]:
+    """
+    Parsea un fichero MorphGNT (se ejecuta en un proceso del pool).
     
-    greek_nt = {}
+    Devuelve los versículos por (capítulo, versículo), o None si el fichero no existe;
+    el libro se añade a la clave en el proceso principal.
+    """
+    book_verses = {}
     
-    for filename, book_name in GREEK_FILE_MAPPING.items():
-        filepath = os.path.join(greek_dir, filename)
-        
-        if not os.path.exists(filepath):
-            print(f"  ⚠️ Archivo no encontrado: {filename}")
-            continue
-        
-        greek_nt[book_name] = {}
-        current_chapter = 0
-        current_verse = 0
-        verse_words = []
-        
-        with open(filepath, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                parts = line.split(None, 3)
-                if len(parts) < 4:
-                    continue
-                
-                code = parts[0]
-                if len(code) != 6 or not code.isdigit():
-                    continue
-                
-                book_code = int(code[0:2])
-                chapter = int(code[2:4])
-                verse = int(code[4:6])
-                
-                text_parts = parts[3].split()
-                if text_parts:
-                    greek_word = text_parts[0]
-                else:
-                    continue
-                
-                if chapter != current_chapter or verse != current_verse:
-                    if current_chapter > 0 and current_verse > 0:
-                        if current_chapter not in greek_nt[book_name]:
-                            greek_nt[book_name][current_chapter] = {}
-                        verse_text = " ".join(verse_words).strip()
-                        greek_nt[book_name][current_chapter][current_verse] = verse_text
-                    
-                    current_chapter = chapter
-                    current_verse = verse
-                    verse_words = [greek_word]
-                else:
-                    verse_words.append(greek_word)
-        
-        if current_chapter > 0 and current_verse > 0:
-            if current_chapter not in greek_nt[book_name]:
-                greek_nt[book_name][current_chapter] = {}
-            verse_text = " ".join(verse_words).strip()
-            greek_nt[book_name][current_chapter][current_verse] = verse_text
-        
-        verse_count = sum(len(chapters) for chapters in greek_nt[book_name].values())
-        print(f"  ✅ {book_name}: {len(greek_nt[book_name])} capítulos, {verse_count} versículos")
+    try:
+        f = open(filepath, 'r', encoding='utf-8', buffering=READ_BUFFER_SIZE)
+    except FileNotFoundError:
+        return book_name, None
     
-    return greek_nt
+    with f:
+        # Formato MorphGNT: "BBCCVV pos parse texto palabra normalizada lema"
+        rows = (line.split(None, 4) for line in f)
+        words = (
+            (parts[0], parts[3])
+            for parts in rows
+            if len(parts) >= 4 and len(parts[0]) == 6 and parts[0].isdigit()
+        )
+        # Las palabras de un versículo son consecutivas: groupby las agrupa en una sola pasada
+        for code, verse_words in groupby(words, key=itemgetter(0)):
+            # BBCCVV -> un solo int y aritmética, sin cortar subcadenas
+            chapter, verse = divmod(int(code) % 10000, 100)
+            if chapter > 0 and verse > 0:
+                # Los tokens vienen de split(): nunca tienen espacios alrededor, no hace falta strip()
+                book_verses[(chapter, verse)] = " ".join([word for _, word in verse_words])
+    
+    return book_name, book_verses
 
 
-def merge_data(
-    spanish_nt: Dict[str, Dict[int, Dict[int, str]]],
-    greek_nt: Dict[str, Dict[int, Dict[int, str]]]
-) -> List[Dict]:
-    """Combina los datos en español y griego."""
-    print("\n🔄 Combinando datos...")
+@functools.lru_cache(maxsize=1)
+def load_greek_nt(greek_dir: str) -> Dict[VerseKey, str]:
+    """
+    Carga el Nuevo Testamento en griego desde los archivos TXT.
     
-    merged = []
+    Cacheado igual que load_spanish_nt: no modificar el diccionario devuelto.
+    """
+    print(f"📖 Cargando textos griegos desde {greek_dir}...")
     
-    all_books = set(spanish_nt.keys()) | set(greek_nt.keys())
+    greek_nt = {}
+    filenames = list(GREEK_FILE_MAPPING)
+    filepaths = [os.path.join(greek_dir, filename) for filename in filenames]
+    stats = []
     
-    for book_name in sorted(all_books):
-        if book_name not in spanish_nt or book_name not in greek_nt:
-            continue
-        
-        spanish_book = spanish_nt[book_name]
-        greek_book = greek_nt[book_name]
-        
-        all_chapters = set(spanish_book.keys()) | set(greek_book.keys())
-        
-        for chapter in sorted(all_chapters):
-            if chapter not in spanish_book or chapter not in greek_book:
+    # Los 27 ficheros son independientes y el parseo es CPU (GIL): un proceso por fichero
+    with ProcessPoolExecutor() as executor:
+        results = executor.map(_parse_greek_file, filepaths, GREEK_FILE_MAPPING.values())
+        for filename, (book_name, book_verses) in zip(filenames, results):
+            if book_verses is None:
+                stats.append(f"  ⚠️ Archivo no encontrado: {filename}")
                 continue
-            
-            spanish_chapter = spanish_book[chapter]
-            greek_chapter = greek_book[chapter]
-            
-            all_verses = set(spanish_chapter.keys()) | set(greek_chapter.keys())
-            
-            for verse in sorted(all_verses):
-                if verse not in spanish_chapter or verse not in greek_chapter:
-                    continue
-                
-                merged.append({
-                    "libro": book_name,
-                    "capitulo": chapter,
-                    "versiculo": verse,
-                    "griego": greek_chapter[verse],
-                    "espanol": spanish_chapter[verse]
-                })
+            # El nombre llega deserializado desde otro proceso: se interna para que
+            # coincida (por identidad) con el de spanish_nt
+            book_name = sys.intern(book_name)
+            greek_nt.update(
+                ((book_name, chapter, verse), text) for (chapter, verse), text in book_verses.items()
+            )
+            chapter_count = len({chapter for chapter, _ in book_verses})
+            stats.append(f"  ✅ {book_name}: {chapter_count} capítulos, {len(book_verses)} versículos")
     
-    return merged
+    _write_stats(stats)
+    
+    return greek_nt
+
+
+def merge_data(
+    spanish_nt: Dict[VerseKey, str],
+    greek_nt: Dict[VerseKey, str]
+) -> Iterator[Verse]:
+    """Combina los datos en español y griego (solo versículos presentes en ambos), en orden canónico.
+
+    Es un generador: cada versículo se produce cuando el escritor lo pide, sin
+    construir la lista completa de registros.
+    """
+    # Verse (dataclass con __slots__) en lugar de un dict de 5 claves por versículo;
+    # orjson serializa los dataclasses directamente como objetos JSON
+    for key in sorted(
+        spanish_nt.keys() & greek_nt.keys(),
+        key=lambda k: (BOOK_ORDER[k[0]], k[1], k[2])
+    ):
+        yield Verse(key[0], key[1], key[2], greek_nt[key], spanish_nt[key])
+
+
+def _hash_inputs(paths: List[Path]) -> str:
+    """SHA-256 del contenido de las entradas (y de este script, que define la salida)."""
+    h = hashlib.sha256()
+    for path in [Path(__file__), *paths]:
+        h.update(path.name.encode('utf-8'))
+        try:
+            h.update(path.read_bytes())
+        except FileNotFoundError:
+            h.update(b"\0missing")
+    return h.hexdigest()
 
 
 def main():
@@ -218,7 +260,7 @@ def main():
     base_dir = Path(__file__).parent.parent
     json_path = base_dir / "data" / "es_rvr" / "es_rvr.json"
     greek_dir = base_dir / "data" / "greek_nt"
-    output_path = base_dir / "data" / "nt_verses.json"
+    output_path = base_dir / "data" / "nt_verses.jsonl"
     
     print("=" * 60)
     print("🔄 Procesador de Datos del Nuevo Testamento")
@@ -232,21 +274,36 @@ def main():
         print(f"❌ Error: No se encuentra {greek_dir}")
         return
     
+    # Si las entradas no han cambiado desde la última ejecución, no hay nada que hacer
+    inputs = [json_path] + [greek_dir / name for name in GREEK_FILE_MAPPING]
+    stamp_path = output_path.with_suffix('.stamp')
+    input_hash = _hash_inputs(inputs)
+    if output_path.exists() and stamp_path.exists() and stamp_path.read_text() == input_hash:
+        print(f"✅ {output_path} ya está al día (entradas sin cambios)")
+        return
+    
     spanish_nt = load_spanish_nt(str(json_path))
     greek_nt = load_greek_nt(str(greek_dir))
     
-    merged_data = merge_data(spanish_nt, greek_nt)
-    
-    print(f"\n💾 Guardando {len(merged_data)} versículos en {output_path}...")
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(merged_data, f, ensure_ascii=False, indent=2)
+    print("\n🔄 Combinando datos...")
+    print(f"💾 Guardando versículos en {output_path}...")
+    # JSONL: un versículo por línea, sin indentación; cada línea se puede leer por separado.
+    # orjson escribe UTF-8 sin escapar (equivale a ensure_ascii=False) y es mucho más rápido.
+    # Los registros se escriben según salen de merge_data; las estadísticas se acumulan al vuelo
+    verses_count = 0
+    books = set()
+    chapters = set()
+    with open(output_path, 'wb') as f:
+        for verse in merge_data(spanish_nt, greek_nt):
+            f.write(orjson.dumps(verse) + b"\n")
+            verses_count += 1
+            books.add(verse.libro)
+            chapters.add((verse.libro, verse.capitulo))
+    stamp_path.write_text(input_hash)
     
     print(f"✅ Proceso completado!")
-    print(f"📊 Total de versículos procesados: {len(merged_data)}")
-    
-    books_count = len(set(v['libro'] for v in merged_data))
-    chapters_count = len(set((v['libro'], v['capitulo']) for v in merged_data))
-    print(f"📚 Libros: {books_count}, Capítulos: {chapters_count}")
+    print(f"📊 Total de versículos procesados: {verses_count}")
+    print(f"📚 Libros: {len(books)}, Capítulos: {len(chapters)}")
 
 
 if __name__ == "__main__":